@@ -9,22 +9,25 @@ v3: Switched from sprite exec (unreliable websocket) to external HTTP API.
     Still uses sprite exec as fallback for file pull-back.
 """
 
+import http.client
 import http.server
 import json
 import subprocess
-import base64
 import os
+import queue
 import re as regex
+import select
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
 
 PORT = 9999
 SPRITE_ORG = "joi-ito"
 SPRITE_NAME = "knowledge-intake"
 SPRITE_BIN = os.path.expanduser("~/.local/bin/sprite")
+SPRITE_ARGV_PREFIX = (SPRITE_BIN, "-o", SPRITE_ORG, "-s", SPRITE_NAME, "exec")
 JIBRAIN_EXTRACTIONS = Path.home() / "jibrain" / "intake"
 JIBRAIN_ROOT = Path.home() / "jibrain"
 SWITCHBOARD_KNOWLEDGE = Path.home() / "switchboard-knowledge"
@@ -41,54 +44,303 @@ def _load_api_key() -> str:
     raise RuntimeError(f"API key not found at {API_KEY_PATH}")
 
 
-def api_request(endpoint: str, method: str = "GET", data: dict | None = None, timeout: int = 120) -> dict:
-    """Make an authenticated request to the knowledge-intake API."""
+# Idle keep-alive connections shared by all handler threads. ThreadingHTTPServer
+# starts a thread per client connection, so a per-thread connection would
+# almost never be reused; a module-level pool is. Connections idle longer
+# than API_IDLE_MAX are assumed to have been closed upstream and dropped.
+API_POOL_SIZE = 4
+API_IDLE_MAX = 5.0
+_api_pool: queue.LifoQueue = queue.LifoQueue(maxsize=API_POOL_SIZE)
+
+
+def _new_api_connection(timeout: int) -> http.client.HTTPConnection:
+    return http.client.HTTPSConnection(urlparse(INTAKE_API_URL).netloc, timeout=timeout)
+
+
+def _idle_connection_usable(conn: http.client.HTTPConnection, idle_since: float) -> bool:
+    """False if conn sat idle too long or the server already closed it.
+
+    An idle keep-alive socket has nothing to read; if select says it is
+    readable, the server sent EOF (or a TLS close_notify) and it is dead.
+    """
+    if conn.sock is None or time.monotonic() - idle_since > API_IDLE_MAX:
+        return False
+    try:
+        return not select.select([conn.sock], [], [], 0)[0]
+    except (OSError, ValueError):
+        return False
+
+
+def _checkout_api_connection(timeout: int, reuse: bool = True) -> tuple[http.client.HTTPConnection, bool]:
+    """Take a live idle pooled connection, or open a new one; return (conn, reused)."""
+    while reuse:
+        try:
+            conn, idle_since = _api_pool.get_nowait()
+        except queue.Empty:
+            break
+        if not _idle_connection_usable(conn, idle_since):
+            conn.close()
+            continue
+        conn.timeout = timeout
+        conn.sock.settimeout(timeout)
+        return conn, True
+    return _new_api_connection(timeout), False
+
+
+def _checkin_api_connection(conn: http.client.HTTPConnection):
+    try:
+        _api_pool.put_nowait((conn, time.monotonic()))
+    except queue.Full:
+        conn.close()
+
+
+def api_request_raw(endpoint: str, method: str = "GET", data: dict | None = None, timeout: int = 120) -> bytes:
+    """Make an authenticated request to the knowledge-intake API; return the raw JSON body."""
     api_key = _load_api_key()
-    url = f"{INTAKE_API_URL}{endpoint}"
     headers = {
         "X-API-Key": api_key,
         "Content-Type": "application/json",
     }
     body = json.dumps(data).encode() if data else None
-    req = Request(url, data=body, headers=headers, method=method)
-    try:
-        with urlopen(req, timeout=timeout) as resp:
-            return json.loads(resp.read().decode())
-    except HTTPError as e:
-        error_body = e.read().decode() if e.fp else str(e)
-        raise RuntimeError(f"API error {e.code}: {error_body}")
-    except URLError as e:
-        raise RuntimeError(f"API connection error: {e.reason}")
+    # POST (/intake) is sporadic and must not be retried, so it always gets a
+    # fresh connection rather than risking one the server closed while idle
+    reuse = method != "POST"
+    while True:
+        conn, reused = _checkout_api_connection(timeout, reuse=reuse)
+        try:
+            conn.request(method, endpoint, body=body, headers=headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+            break
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+            conn.close()
+            # A reused connection died under us: retry on the next one
+            if not reused:
+                raise RuntimeError(f"API connection error: {e}")
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            raise RuntimeError(f"API connection error: {e}")
+    if resp.will_close:
+        conn.close()
+    else:
+        _checkin_api_connection(conn)
+    if resp.status >= 400:
+        raise RuntimeError(f"API error {resp.status}: {raw.decode(errors='replace')}")
+    return raw
 
 
-def sprite_exec(cmd: str, timeout: int = 120) -> str:
-    """Run a command inside the sprite via sprite exec (fallback for file ops)."""
-    result = subprocess.run(
-        [SPRITE_BIN, "-o", SPRITE_ORG, "-s", SPRITE_NAME, "exec", "bash", "-c", cmd],
-        capture_output=True, text=True, timeout=timeout
-    )
-    out = result.stdout.strip()
-    if out:
+def api_request(endpoint: str, method: str = "GET", data: dict | None = None, timeout: int = 120) -> dict:
+    """Make an authenticated request to the knowledge-intake API."""
+    return json.loads(api_request_raw(endpoint, method=method, data=data, timeout=timeout))
+
+
+# Upstream /health is reused for this long, so 1-5 Hz pollers mostly get an
+# instant answer; concurrent misses share a single upstream call. Failures are
+# cached for the same TTL, so an outage costs one HEALTH_TIMEOUT per TTL
+# rather than one per poller. A last-good body is served as "stale" for at
+# most HEALTH_STALE_MAX seconds; after that the outage surfaces as a 502.
+HEALTH_CACHE_TTL = 1.0
+HEALTH_TIMEOUT = 5
+HEALTH_STALE_MAX = 30.0
+_health_cache = {"ts": 0.0, "ok_ts": 0.0, "body": None, "served": None, "error": None}
+_health_lock = threading.Lock()
+
+
+def cached_health() -> bytes:
+    """Return the upstream /health body, cached for HEALTH_CACHE_TTL seconds.
+
+    If the upstream call fails within HEALTH_STALE_MAX of the last success,
+    that body is served with "stale": true; otherwise the error is raised.
+    """
+    with _health_lock:
+        if time.monotonic() - _health_cache["ts"] < HEALTH_CACHE_TTL:
+            if _health_cache["error"] is not None:
+                raise RuntimeError(_health_cache["error"])
+            if _health_cache["served"] is not None:
+                return _health_cache["served"]
         try:
-            json.loads(out)
-            return out
-        except json.JSONDecodeError:
-            pass
-    if result.returncode != 0:
-        raise RuntimeError(result.stderr.strip() or out or "sprite exec failed")
-    return out
+            body = api_request_raw("/health", timeout=HEALTH_TIMEOUT)
+        except RuntimeError as e:
+            now = time.monotonic()
+            _health_cache["ts"] = now
+            if _health_cache["body"] is None or now - _health_cache["ok_ts"] > HEALTH_STALE_MAX:
+                _health_cache["error"] = str(e)
+                _health_cache["served"] = None
+                raise
+            print(f"[relay] Upstream /health failed, serving stale: {e}", flush=True)
+            stale = json.loads(_health_cache["body"])
+            if isinstance(stale, dict):
+                stale["stale"] = True
+            _health_cache["served"] = json.dumps(stale).encode()
+            _health_cache["error"] = None
+            return _health_cache["served"]
+        now = time.monotonic()
+        _health_cache.update(ts=now, ok_ts=now, body=body, served=body, error=None)
+        return body
+
+
+# A shell idle for longer than SPRITE_IDLE_PING is pinged before reuse, so a
+# half-open sprite websocket is replaced before a real command is sent to it
+SPRITE_IDLE_PING = 10
+SPRITE_PING_TIMEOUT = 15
+# After the shell fails to start or answer, go straight to one-shot exec for
+# this long instead of paying SPRITE_PING_TIMEOUT on every pull-back
+SPRITE_SESSION_COOLDOWN = 300
+
+
+class SpriteSessionError(RuntimeError):
+    """The persistent sprite shell could not be started or did not answer.
+
+    Only raised before the caller's command was written, so falling back to
+    a one-shot sprite exec can never run a command twice.
+    """
+
+
+class SpriteShellDied(RuntimeError):
+    """The persistent sprite shell exited while a command was running."""
 
 
-def sprite_cat(remote_path: str, timeout: int = 30) -> str:
-    """Read a file from inside the sprite (fallback)."""
+class SpriteSession:
+    """One long-lived `sprite exec bash` shell shared by all handler threads.
+
+    Each command runs in a ( ... ) subshell, so cd/exports/exit don't leak
+    into later requests. After it, the shell prints a per-session sentinel
+    and the exit status on stdout and the sentinel on stderr; both pipes are
+    read up to their sentinel. This pays the sprite websocket handshake and
+    bash startup once instead of on every file pull.
+    """
+
+    def __init__(self):
+        self._proc: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+        self._sentinel = f"__END_{os.urandom(8).hex()}__"
+        self._last_used = 0.0
+        self._down_until = 0.0
+
+    def _start(self):
+        try:
+            self._proc = subprocess.Popen(
+                [*SPRITE_ARGV_PREFIX, "bash"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                bufsize=0,
+            )
+        except OSError as e:
+            raise SpriteSessionError(f"sprite shell failed to start: {e}")
+
+    def _kill(self):
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.wait()
+            for pipe in (self._proc.stdin, self._proc.stdout, self._proc.stderr):
+                pipe.close()
+            self._proc = None
+
+    def _exchange(self, cmd: str, timeout: float) -> tuple[int, bytes, bytes]:
+        """Send one framed command; kill the shell if it dies or times out."""
+        proc = self._proc
+        # stdin is redirected so cmd can't swallow the framing that follows it
+        framed = (f"( {cmd}\n) </dev/null\n"
+                  f"printf '\\n%s%d\\n' {self._sentinel} $?\n"
+                  f"printf '\\n%s\\n' {self._sentinel} >&2\n")
+        try:
+            proc.stdin.write(framed.encode())
+        except OSError as e:
+            self._kill()
+            raise SpriteShellDied(f"sprite shell write failed: {e}")
+
+        marker = b"\n" + self._sentinel.encode()
+        err_marker = marker + b"\n"
+        out, err = bytearray(), bytearray()
+        out_idx = -1
+        status = None
+        err_done = False
+        deadline = time.monotonic() + timeout
+        while status is None or not err_done:
+            pending = []
+            if status is None:
+                pending.append(proc.stdout.fileno())
+            if not err_done:
+                pending.append(proc.stderr.fileno())
+            remaining = deadline - time.monotonic()
+            ready = select.select(pending, [], [], remaining)[0] if remaining > 0 else []
+            if not ready:
+                self._kill()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            for fd in ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    self._kill()
+                    raise SpriteShellDied("sprite shell exited")
+                # Only the newly read bytes (plus a marker's worth of overlap)
+                # can complete a sentinel, so don't rescan the whole buffer
+                if fd == proc.stdout.fileno():
+                    out += chunk
+                    if out_idx == -1:
+                        out_idx = out.find(marker, max(0, len(out) - len(chunk) - len(marker)))
+                    end = out.find(b"\n", out_idx + len(marker)) if out_idx != -1 else -1
+                    if end != -1:
+                        status = int(out[out_idx + len(marker):end])
+                        del out[out_idx:]
+                else:
+                    err += chunk
+                    idx = err.find(err_marker, max(0, len(err) - len(chunk) - len(err_marker)))
+                    if idx != -1:
+                        err_done = True
+                        del err[idx:]
+        return status, bytes(out), bytes(err)
+
+    def _ensure_shell(self):
+        """Make sure a responsive shell is running, replacing a dead or hung one."""
+        if time.monotonic() < self._down_until:
+            raise SpriteSessionError("sprite shell unavailable, cooling down")
+        if self._proc is not None and self._proc.poll() is None:
+            if time.monotonic() - self._last_used < SPRITE_IDLE_PING:
+                return
+            try:
+                self._exchange(":", SPRITE_PING_TIMEOUT)
+                return
+            except (SpriteShellDied, subprocess.TimeoutExpired):
+                pass
+        self._kill()
+        try:
+            self._start()
+            self._exchange(":", SPRITE_PING_TIMEOUT)
+        except (SpriteSessionError, SpriteShellDied, subprocess.TimeoutExpired) as e:
+            self._down_until = time.monotonic() + SPRITE_SESSION_COOLDOWN
+            raise SpriteSessionError(f"sprite shell not responding: {e}")
+
+    def run(self, cmd: str, timeout: float = 120) -> tuple[int, bytes, bytes]:
+        """Run cmd in the shared shell; return (exit status, stdout, stderr).
+
+        Raises SpriteSessionError if no shell is available (cmd not sent),
+        SpriteShellDied or TimeoutExpired if it failed while cmd was running.
+        """
+        with self._lock:
+            self._ensure_shell()
+            try:
+                return self._exchange(cmd, timeout)
+            finally:
+                self._last_used = time.monotonic()
+
+
+sprite_session = SpriteSession()
+
+
+def _sprite_run(cmd: str, timeout: float) -> tuple[int, bytes, bytes]:
+    """Run cmd via the shared session, falling back to a one-shot sprite exec.
+
+    The fallback only happens when the session never received cmd; a shell
+    that dies or times out mid-command raises instead of re-running it.
+    """
+    try:
+        return sprite_session.run(cmd, timeout=timeout)
+    except SpriteSessionError as e:
+        print(f"[relay] Sprite session unavailable, using one-shot exec: {e}", flush=True)
     result = subprocess.run(
-        [SPRITE_BIN, "-o", SPRITE_ORG, "-s", SPRITE_NAME, "exec", "bash", "-c",
-         f"cat {remote_path}"],
-        capture_output=True, text=True, timeout=timeout
+        [*SPRITE_ARGV_PREFIX, "bash", "-c", cmd],
+        capture_output=True, timeout=timeout
     )
-    if result.returncode != 0:
-        raise RuntimeError(f"Failed to read {remote_path}: {result.stderr}")
-    return result.stdout
+    return result.returncode, result.stdout, result.stderr
 
 
 def inject_frontmatter_tags(content: str, extra_tags: list[str]) -> str:
@@ -128,31 +380,56 @@ def inject_frontmatter_tags(content: str, extra_tags: list[str]) -> str:
     return f"---{fm_text}---{body}"
 
 
+META_SEPARATOR = b"\0---META---\0"
+
+
+def write_atomic(path: Path, data: bytes):
+    """Write data to a sibling temp file, then rename it over path.
+
+    Syncthing (and any other reader) only ever sees the old file or the
+    complete new one, never a partial write.
+    """
+    tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
 def pull_extraction(file_path: str, extra_tags: list[str] | None = None):
-    """Pull extraction file from sprite to local jibrain."""
+    """Pull extraction file (and its .meta JSON, if any) from sprite to local jibrain."""
     filename = Path(file_path).name
+    stem = Path(filename).stem
     remote_path = f"/home/sprite/vault/{file_path}"
-    content = sprite_cat(remote_path)
+    meta_remote = f"/home/sprite/vault/agents/curator/extractions/.meta/{stem}.json"
+
+    # One round-trip for both files; the meta half is empty if it doesn't exist
+    cmd = (f"cat {remote_path} && {{ printf '\\0---META---\\0'; "
+           f"cat {meta_remote} 2>/dev/null; true; }}")
+    status, stdout, stderr = _sprite_run(cmd, timeout=30)
+    if status != 0:
+        raise RuntimeError(f"Failed to read {remote_path}: {stderr.decode() or f'exit {status}'}")
+    content, _, meta_content = stdout.partition(META_SEPARATOR)
 
-    # Inject extra tags (e.g., ws:medtech:hbot) into frontmatter
+    # Inject extra tags (e.g., ws:medtech:hbot) into frontmatter; only this
+    # path needs the text, otherwise the bytes are written through untouched
     if extra_tags:
-        content = inject_frontmatter_tags(content, extra_tags)
+        content = inject_frontmatter_tags(content.decode("utf-8"), extra_tags).encode("utf-8")
         print(f"[relay] Injected tags {extra_tags} into {filename}", flush=True)
 
     local_path = JIBRAIN_EXTRACTIONS / filename
-    local_path.write_text(content, encoding="utf-8")
+    write_atomic(local_path, content)
     print(f"[relay] Pulled {filename} -> {local_path} ({len(content)} bytes)", flush=True)
 
-    # Also pull .meta JSON if it exists
-    stem = Path(filename).stem
-    meta_remote = f"/home/sprite/vault/agents/curator/extractions/.meta/{stem}.json"
-    try:
-        meta_content = sprite_cat(meta_remote)
-        meta_dir = JIBRAIN_EXTRACTIONS / ".meta"
-        meta_dir.mkdir(parents=True, exist_ok=True)
-        (meta_dir / f"{stem}.json").write_text(meta_content, encoding="utf-8")
-    except Exception:
-        pass
+    if meta_content:
+        try:
+            meta_dir = JIBRAIN_EXTRACTIONS / ".meta"
+            meta_dir.mkdir(parents=True, exist_ok=True)
+            write_atomic(meta_dir / f"{stem}.json", meta_content)
+        except Exception:
+            pass
 
 
 def structured_intake(payload: dict) -> dict:
@@ -297,15 +574,24 @@ def search_vault(query: str, limit: int = 20) -> dict:
 
 
 class RelayHandler(http.server.BaseHTTPRequestHandler):
+    # Persistent connections so /health polling skips a TCP handshake per call;
+    # idle keep-alive sockets are dropped after `timeout` seconds
+    protocol_version = "HTTP/1.1"
+    timeout = 60
+
     def log_message(self, format, *args):
         print(f"[relay] {args[0]}", flush=True)
 
     def _respond(self, code: int, body: dict):
-        data = json.dumps(body).encode()
+        self._respond_raw(code, json.dumps(body).encode())
+
+    def _respond_raw(self, code: int, data: bytes):
+        """Send an already-serialized JSON body as-is."""
         self.send_response(code)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(data)))
         self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Connection", "close" if self.close_connection else "keep-alive")
         self.end_headers()
         self.wfile.write(data)
 
@@ -315,16 +601,16 @@ class RelayHandler(http.server.BaseHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def do_GET(self):
         try:
             if self.path == "/health":
-                result = api_request("/health")
-                self._respond(200, result)
+                # Upstream body is already JSON: forward it without a parse/dump pass
+                self._respond_raw(200, cached_health())
             elif self.path == "/recent":
-                result = api_request("/recent")
-                self._respond(200, result)
+                self._respond_raw(200, api_request_raw("/recent"))
             elif self.path == "/relay-health":
                 self._respond(200, {
                     "status": "ok", "relay": "bookmark-relay", "port": PORT,
@@ -455,9 +741,16 @@ class RelayHandler(http.server.BaseHTTPRequestHandler):
 
     def do_POST(self):
         try:
+            if "Transfer-Encoding" in self.headers:
+                # Chunked bodies aren't read; on a keep-alive socket the leftover
+                # bytes would be parsed as the next request
+                self.close_connection = True
             length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(length).decode() if length else "{}"
-            payload = json.loads(body)
+            if length < 0:
+                raise ValueError(f"invalid Content-Length: {length}")
+            # json.loads accepts bytes, so skip the intermediate str copy
+            raw = self.rfile.read(length) if length else b"{}"
+            payload = json.loads(raw)
 
             if self.path == "/intake":
                 if "url" not in payload:
@@ -515,12 +808,14 @@ class RelayHandler(http.server.BaseHTTPRequestHandler):
         except json.JSONDecodeError:
             self._respond(400, {"error": "invalid JSON"})
         except Exception as e:
+            # The body may not have been read (e.g. bad Content-Length)
+            self.close_connection = True
             self._respond(502, {"error": str(e)})
 
 
 if __name__ == "__main__":
     JIBRAIN_EXTRACTIONS.mkdir(parents=True, exist_ok=True)
-    server = http.server.HTTPServer(("0.0.0.0", PORT), RelayHandler)
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", PORT), RelayHandler)
     print(f"[relay] Bookmark relay v3 listening on :{PORT}", flush=True)
     print(f"[relay] API: {INTAKE_API_URL}", flush=True)
     print(f"[relay] Jibrain extractions: {JIBRAIN_EXTRACTIONS}", flush=True)
@@ -2,6 +2,8 @@
 """
 Apple Reminders bridge for NanoClaw.
 Uses EventKit via PyObjC. Reads JSON from stdin, outputs JSON to stdout.
+With --daemon, stays running and handles one JSON request per line.
+Optional: pyobjc-framework-libdispatch (completion waits), orjson (output).
 
 Operations:
   list_lists      - List all reminder lists
@@ -15,40 +17,92 @@ Operations:
 import json
 import sys
 import threading
+from collections import defaultdict
 from datetime import datetime, timezone
+from operator import itemgetter
 
 import EventKit
 import objc
 
+# Completion handlers signal a libdispatch semaphore when
+# pyobjc-framework-libdispatch is installed, else a threading.Event. The
+# callback is Python either way; this is a wait primitive, not a native path.
+try:
+    import dispatch
+
+    def new_semaphore():
+        return dispatch.dispatch_semaphore_create(0)
+
+    def signal_semaphore(sem):
+        dispatch.dispatch_semaphore_signal(sem)
+
+    def wait_semaphore(sem, seconds):
+        """Block until sem is signalled by an EventKit completion handler, or timeout."""
+        deadline = dispatch.dispatch_time(dispatch.DISPATCH_TIME_NOW, int(seconds * dispatch.NSEC_PER_SEC))
+        dispatch.dispatch_semaphore_wait(sem, deadline)
+except ImportError:
+    def new_semaphore():
+        return threading.Event()
+
+    def signal_semaphore(sem):
+        sem.set()
+
+    def wait_semaphore(sem, seconds):
+        """Block until sem is signalled by an EventKit completion handler, or timeout."""
+        sem.wait(timeout=seconds)
+
+# orjson is a C extension and much faster on large snapshots; optional
+try:
+    import orjson
+
+    def dumps(obj):
+        # PyObjC strings are str subclasses, which orjson rejects as dict keys
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:
+    def dumps(obj):
+        return json.dumps(obj)
+
 # ── EventKit setup ──────────────────────────────────────────────
 
 store = EventKit.EKEventStore.alloc().init()
 
 def request_access():
-    event = threading.Event()
+    sem = new_semaphore()
     result = [False]
     def cb(granted, error):
         result[0] = granted
-        event.set()
+        signal_semaphore(sem)
     store.requestFullAccessToRemindersWithCompletion_(cb)
-    event.wait(timeout=10)
+    wait_semaphore(sem, 10)
     if not result[0]:
-        print(json.dumps({"error": "Reminders access denied. Grant permission in System Settings > Privacy & Security > Reminders."}))
+        print(dumps({"error": "Reminders access denied. Grant permission in System Settings > Privacy & Security > Reminders."}))
         sys.exit(1)
 
+_cals = None
+_cals_by_name = {}
+
 def get_calendars():
-    """Get all reminder calendars (lists)."""
-    return store.calendarsForEntityType_(EventKit.EKEntityTypeReminder)
+    """Get all reminder calendars (lists), cached until invalidate_calendars()."""
+    global _cals
+    if _cals is None:
+        _cals = store.calendarsForEntityType_(EventKit.EKEntityTypeReminder)
+        _cals_by_name.clear()
+        for cal in _cals:
+            _cals_by_name.setdefault(cal.title().lower(), cal)
+    return _cals
+
+def invalidate_calendars():
+    """Drop the cached calendars so the next lookup asks EventKit again."""
+    global _cals
+    _cals = None
 
 def find_calendar(name):
     """Find a calendar by name (case-insensitive)."""
-    for cal in get_calendars():
-        if cal.title().lower() == name.lower():
-            return cal
-    return None
+    get_calendars()
+    return _cals_by_name.get(name.lower())
 
-def fetch_reminders(calendars=None, completed=False):
-    """Fetch reminders synchronously."""
+def start_fetch(calendars=None, completed=False):
+    """Start an async reminder fetch; pass the returned handle to finish_fetch."""
     if calendars is None:
         calendars = get_calendars()
     
@@ -61,39 +115,92 @@ def fetch_reminders(calendars=None, completed=False):
             None, None, calendars
         )
     
-    event = threading.Event()
+    sem = new_semaphore()
     results = [None]
     def cb(reminders):
         results[0] = reminders if reminders else []
-        event.set()
+        signal_semaphore(sem)
     store.fetchRemindersMatchingPredicate_completion_(predicate, cb)
-    event.wait(timeout=30)
+    return sem, results
+
+def finish_fetch(pending, seconds=30):
+    """Wait for a fetch started by start_fetch and return its reminders."""
+    sem, results = pending
+    wait_semaphore(sem, seconds)
     return results[0] or []
 
+def fetch_reminders(calendars=None, completed=False):
+    """Fetch reminders synchronously."""
+    return finish_fetch(start_fetch(calendars, completed))
+
 def reminder_to_dict(r):
     """Convert EKReminder to dict."""
+    # Each accessor is a PyObjC bridge call, so read every property once
     due = None
-    if r.dueDateComponents():
-        dc = r.dueDateComponents()
+    dc = r.dueDateComponents()
+    if dc:
         try:
             due = f"{dc.year():04d}-{dc.month():02d}-{dc.day():02d}"
-            if dc.hour() is not None and dc.hour() != 9223372036854775807:
-                due += f"T{dc.hour():02d}:{dc.minute():02d}:00"
+            hour = dc.hour()
+            if hour is not None and hour != 9223372036854775807:
+                due += f"T{hour:02d}:{dc.minute():02d}:00"
         except:
             pass
     
     cal = r.calendar()
+    created = r.creationDate()
     return {
         "id": r.calendarItemExternalIdentifier(),
         "title": r.title() or "",
-        "list_name": cal.title() if cal else "Unknown",
+        "list_name": str(cal.title()) if cal else "Unknown",
         "completed": bool(r.isCompleted()),
         "due_date": due,
         "priority": int(r.priority()),
         "notes": r.notes() or "",
-        "creation_date": r.creationDate().description() if r.creationDate() else None,
+        "creation_date": created.description() if created else None,
     }
 
+def find_reminder(reminder_id=None, title_match=None):
+    """Find an incomplete reminder by external id, else by title substring.
+
+    An id is resolved directly through the store; only a title match needs
+    the full fetch-and-scan of every list.
+    """
+    if reminder_id:
+        for item in store.calendarItemsWithExternalIdentifier_(reminder_id) or []:
+            if isinstance(item, EventKit.EKReminder) and not item.isCompleted():
+                return item
+        if not title_match:
+            return None
+    
+    for r in fetch_reminders(completed=False):
+        if reminder_id and r.calendarItemExternalIdentifier() == reminder_id:
+            return r
+        if title_match and title_match.lower() in (r.title() or "").lower():
+            return r
+    return None
+
+def sort_by_due(result):
+    """Order reminder dicts: overdue first, then upcoming, then undated.
+
+    Partitioning first means each bucket sorts on the bare due_date string
+    rather than building a (bucket, due_date) key per element.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    overdue, upcoming, undated = [], [], []
+    for r in result:
+        due = r["due_date"]
+        if due is None:
+            undated.append(r)
+        elif due[:10] < today:
+            overdue.append(r)
+        else:
+            upcoming.append(r)
+    by_due = itemgetter("due_date")
+    overdue.sort(key=by_due)
+    upcoming.sort(key=by_due)
+    return overdue + upcoming + undated
+
 # ── Operations ──────────────────────────────────────────────────
 
 def op_list_lists(_params):
@@ -111,22 +218,13 @@ def op_list_reminders(params):
             return {"error": f"List {list_name} not found"}
         cals = [cal]
     
-    reminders = fetch_reminders(cals, completed=False)
-    result = [reminder_to_dict(r) for r in reminders]
-    
+    # Start both fetches before waiting so their EventKit round-trips overlap
+    pending = [start_fetch(cals, completed=False)]
     if include_completed:
-        completed = fetch_reminders(cals, completed=True)
-        result.extend(reminder_to_dict(r) for r in completed)
-    
-    # Sort: overdue first, then by due date
-    def sort_key(r):
-        if r["due_date"] is None:
-            return (2, "9999")
-        today = datetime.now().strftime("%Y-%m-%d")
-        is_overdue = r["due_date"][:10] < today
-        return (0 if is_overdue else 1, r["due_date"])
+        pending.append(start_fetch(cals, completed=True))
+    result = [reminder_to_dict(r) for p in pending for r in finish_fetch(p)]
     
-    result.sort(key=sort_key)
+    result = sort_by_due(result)
     return {"reminders": result, "count": len(result)}
 
 def op_create_reminder(params):
@@ -184,17 +282,7 @@ def op_complete_reminder(params):
     if not reminder_id and not title_match:
         return {"error": "reminder_id or title_match required"}
     
-    # Search across all lists
-    reminders = fetch_reminders(completed=False)
-    target = None
-    for r in reminders:
-        if reminder_id and r.calendarItemExternalIdentifier() == reminder_id:
-            target = r
-            break
-        if title_match and title_match.lower() in (r.title() or "").lower():
-            target = r
-            break
-    
+    target = find_reminder(reminder_id, title_match)
     if not target:
         return {"error": f"Reminder not found"}
     
@@ -212,16 +300,7 @@ def op_update_reminder(params):
     if not reminder_id and not title_match:
         return {"error": "reminder_id or title_match required"}
     
-    reminders = fetch_reminders(completed=False)
-    target = None
-    for r in reminders:
-        if reminder_id and r.calendarItemExternalIdentifier() == reminder_id:
-            target = r
-            break
-        if title_match and title_match.lower() in (r.title() or "").lower():
-            target = r
-            break
-    
+    target = find_reminder(reminder_id, title_match)
     if not target:
         return {"error": "Reminder not found"}
     
@@ -256,26 +335,15 @@ def op_update_reminder(params):
 def op_snapshot(_params):
     """Full snapshot of all incomplete reminders for cache."""
     reminders = fetch_reminders(completed=False)
-    result = [reminder_to_dict(r) for r in reminders]
-    
-    def sort_key(r):
-        if r["due_date"] is None:
-            return (2, "9999")
-        today = datetime.now().strftime("%Y-%m-%d")
-        return (0 if r["due_date"][:10] < today else 1, r["due_date"])
+    result = sort_by_due([reminder_to_dict(r) for r in reminders])
     
-    result.sort(key=sort_key)
-    
-    lists = {}
+    lists = defaultdict(list)
     for r in result:
-        ln = r["list_name"]
-        if ln not in lists:
-            lists[ln] = []
-        lists[ln].append(r)
+        lists[r["list_name"]].append(r)
     
     return {
         "reminders": result,
-        "by_list": lists,
+        "by_list": dict(lists),
         "total": len(result),
         "timestamp": datetime.now().isoformat(),
     }
@@ -291,30 +359,75 @@ OPS = {
     "snapshot": op_snapshot,
 }
 
+def handle_request(req):
+    """Run one request dict; return (result, ok)."""
+    op = req.get("operation") if isinstance(req, dict) else None
+    if op not in OPS:
+        return {"error": f"Unknown operation: {op}. Valid: {list(OPS.keys())}"}, False
+    try:
+        return OPS[op](req.get("params", {})), True
+    except Exception as e:
+        return {"error": str(e)}, False
+
+def encode_result(result, ok):
+    """Serialize a result for stdout; return (line, ok).
+
+    A result that can't be serialized becomes an error object instead of a
+    traceback, so the caller always gets one JSON document back.
+    """
+    try:
+        return dumps(result), ok
+    except (TypeError, ValueError) as e:
+        return dumps({"error": f"Failed to serialize result: {e}"}), False
+
+def serve():
+    """Daemon mode: one JSON request per stdin line, one JSON result per stdout line.
+
+    Interpreter startup, EventKit import and the access prompt are paid once
+    for the whole session instead of once per call.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except json.JSONDecodeError as e:
+            result = {"error": f"Invalid JSON: {e}"}
+        else:
+            try:
+                # Lists may have been added or renamed since the last request
+                store.refreshSourcesIfNecessary()
+                invalidate_calendars()
+            except Exception as e:
+                result = {"error": str(e)}
+            else:
+                result, _ok = handle_request(req)
+        out, _ok = encode_result(result, True)
+        sys.stdout.write(out + "\n")
+        sys.stdout.flush()
+
 def main():
     request_access()
     
+    if "--daemon" in sys.argv[1:]:
+        serve()
+        return
+    
     raw = sys.stdin.read().strip()
     if not raw:
-        print(json.dumps({"error": "No input"}))
+        print(dumps({"error": "No input"}))
         sys.exit(1)
     
     try:
         req = json.loads(raw)
     except json.JSONDecodeError as e:
-        print(json.dumps({"error": f"Invalid JSON: {e}"}))
+        print(dumps({"error": f"Invalid JSON: {e}"}))
         sys.exit(1)
     
-    op = req.get("operation")
-    if op not in OPS:
-        print(json.dumps({"error": f"Unknown operation: {op}. Valid: {list(OPS.keys())}"}))
-        sys.exit(1)
-    
-    try:
-        result = OPS[op](req.get("params", {}))
-        print(json.dumps(result))
-    except Exception as e:
-        print(json.dumps({"error": str(e)}))
+    out, ok = encode_result(*handle_request(req))
+    print(out)
+    if not ok:
         sys.exit(1)
 
 if __name__ == "__main__":
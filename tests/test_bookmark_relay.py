@@ -0,0 +1,507 @@
+"""Tests for scripts/bookmark-relay.py HTTP handling, API pool, sprite session, file pull-back and /health cache."""
+
+import http.client
+import http.server
+import importlib.util
+import json
+import os
+import signal
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+
+def load_module():
+    """Load bookmark-relay.py as a module (hyphen in name requires importlib)."""
+    spec = importlib.util.spec_from_file_location(
+        "bookmark_relay",
+        Path(__file__).parent.parent / "scripts" / "bookmark-relay.py",
+    )
+    assert spec is not None and spec.loader is not None
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@pytest.fixture()
+def api(monkeypatch):
+    """Local keep-alive HTTP server standing in for the knowledge-intake API.
+
+    Like a real upstream, it closes connections left idle (here after 0.3s).
+    """
+    state = {"requests": [], "peers": set(), "drop": set()}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        timeout = 0.3
+
+        def log_message(self, *args):
+            pass
+
+        def _handle(self):
+            n = len(state["requests"])
+            state["requests"].append(self.command)
+            state["peers"].add(self.client_address)
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if n in state["drop"]:
+                # Read the request, then hang up without answering
+                self.close_connection = True
+                return
+            data = json.dumps({"n": n}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = _handle
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    mod = load_module()
+    monkeypatch.setattr(mod, "_load_api_key", lambda: "test-key")
+    monkeypatch.setattr(
+        mod, "_new_api_connection",
+        lambda timeout: http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=timeout),
+    )
+    yield mod, state
+    server.shutdown()
+    server.server_close()
+
+
+def test_api_request_reuses_pooled_connection_across_calls(api):
+    mod, state = api
+
+    results = [mod.api_request("/recent") for _ in range(5)]
+
+    assert [r["n"] for r in results] == [0, 1, 2, 3, 4]
+    assert len(state["peers"]) == 1
+
+
+def test_api_request_retries_get_when_pooled_connection_was_dropped(api):
+    mod, state = api
+    mod.api_request("/health")
+    state["drop"].add(1)
+
+    assert mod.api_request("/health") == {"n": 2}
+    assert state["requests"] == ["GET", "GET", "GET"]
+    assert len(state["peers"]) == 2
+
+
+def test_api_request_never_retries_post(api):
+    mod, state = api
+    mod.api_request("/health")
+    state["drop"].add(1)
+
+    with pytest.raises(RuntimeError, match="API connection error"):
+        mod.api_request("/intake", method="POST", data={"url": "https://example.com"})
+    assert state["requests"] == ["GET", "POST"]
+
+
+def test_api_request_post_after_server_closed_idle_connection_succeeds(api):
+    mod, state = api
+    mod.api_request("/health")
+    time.sleep(0.6)  # server drops the idle pooled connection
+
+    assert mod.api_request("/intake", method="POST", data={"url": "https://example.com"}) == {"n": 1}
+    assert state["requests"] == ["GET", "POST"]
+
+
+def test_api_request_post_never_uses_pooled_connection(api):
+    mod, state = api
+    mod.api_request("/health")
+
+    mod.api_request("/intake", method="POST", data={"url": "https://example.com"})
+
+    assert len(state["peers"]) == 2
+
+
+def test_api_checkout_skips_pooled_connection_closed_by_server(api, monkeypatch):
+    mod, _state = api
+    monkeypatch.setattr(mod, "API_IDLE_MAX", 60.0)
+    mod.api_request("/health")
+    time.sleep(0.6)  # closed upstream but still within API_IDLE_MAX
+
+    conn, reused = mod._checkout_api_connection(timeout=5)
+    conn.close()
+    assert reused is False
+    assert mod._api_pool.empty()
+
+
+@pytest.fixture()
+def relay():
+    """The relay's own handler served on a local port; yields (mod, port)."""
+    mod = load_module()
+    server = mod.http.server.ThreadingHTTPServer(("127.0.0.1", 0), mod.RelayHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield mod, server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def send_raw(port, data):
+    """Write raw bytes on one socket; return everything read until the server closes it."""
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(data)
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def test_relay_keeps_connection_alive_between_requests(relay):
+    _mod, port = relay
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+
+    for _ in range(2):
+        conn.request("GET", "/relay-health")
+        resp = conn.getresponse()
+        resp.read()
+        assert (resp.status, resp.getheader("Connection")) == (200, "keep-alive")
+    conn.close()
+
+
+@pytest.mark.parametrize("headers", [
+    b"Content-Length: abc\r\n",
+    b"Content-Length: -1\r\n",
+    b"Transfer-Encoding: chunked\r\n",
+])
+def test_relay_closes_connection_when_post_body_is_not_consumed(relay, headers):
+    _mod, port = relay
+    request = (b"POST /intake/structured HTTP/1.1\r\nHost: x\r\n" + headers + b"\r\n{}"
+               + b"GET /relay-health HTTP/1.1\r\nHost: x\r\n\r\n")
+
+    reply = send_raw(port, request)
+
+    assert reply.count(b"HTTP/1.1 ") == 1
+    assert b"Connection: close\r\n" in reply
+    assert b"Unsupported method" not in reply
+
+
+@pytest.fixture()
+def session(monkeypatch):
+    """SpriteSession driving a local bash instead of `sprite exec`."""
+    mod = load_module()
+    monkeypatch.setattr(mod, "SPRITE_ARGV_PREFIX", ())
+    yield mod, mod.sprite_session
+    mod.sprite_session._kill()
+
+
+def test_sprite_session_frames_output_and_reuses_shell(session):
+    _mod, sess = session
+
+    assert sess.run("printf 'no newline'") == (0, b"no newline", b"")
+    pid = sess._proc.pid
+    assert sess.run("printf 'a\\nb\\n'; read x; echo \"[$x]\"") == (0, b"a\nb\n[]\n", b"")
+    assert sess._proc.pid == pid
+
+
+def test_sprite_session_isolates_state_between_commands(session):
+    _mod, sess = session
+
+    assert sess.run("cd / && export LEAK=1 && pwd") == (0, b"/\n", b"")
+    assert sess.run("pwd; echo \"${LEAK:-unset}\"") == (0, f"{os.getcwd()}\nunset\n".encode(), b"")
+    assert sess.run("exit 4")[0] == 4
+    assert sess.run("echo still here") == (0, b"still here\n", b"")
+
+
+def test_sprite_session_reports_status_and_stderr(session):
+    _mod, sess = session
+
+    assert sess.run("echo out; echo err >&2; false") == (1, b"out\n", b"err\n")
+
+
+def test_sprite_session_timeout_kills_shell_and_next_call_respawns(session):
+    _mod, sess = session
+    sess.run(":")
+    pid = sess._proc.pid
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        sess.run("sleep 5", timeout=0.3)
+
+    assert sess.run("echo ok") == (0, b"ok\n", b"")
+    assert sess._proc.pid != pid
+
+
+def test_sprite_session_replaces_hung_idle_shell(session, monkeypatch):
+    mod, sess = session
+    sess.run(":")
+    hung = sess._proc.pid
+    os.kill(hung, signal.SIGSTOP)  # stands in for a half-open websocket
+    monkeypatch.setattr(mod, "SPRITE_IDLE_PING", 0)
+    monkeypatch.setattr(mod, "SPRITE_PING_TIMEOUT", 0.3)
+
+    assert sess.run("echo ok") == (0, b"ok\n", b"")
+    assert sess._proc.pid != hung
+
+
+def test_sprite_run_does_not_rerun_command_when_shell_dies(session, tmp_path):
+    mod, _sess = session
+    log = tmp_path / "runs"
+
+    with pytest.raises(mod.SpriteShellDied):
+        mod._sprite_run(f"echo run >> {log}; kill $$", timeout=5)
+
+    assert log.read_text() == "run\n"
+
+
+@pytest.fixture()
+def no_session_sprite(session, tmp_path, monkeypatch):
+    """Fake sprite that refuses the interactive `bash` session but runs `bash -c cmd`."""
+    mod, sess = session
+    log = tmp_path / "invocations"
+    fake = tmp_path / "sprite"
+    fake.write_text(f'#!/bin/bash\necho "$#" >> {log}\n[ $# -eq 1 ] && exit 1\nexec "$@"\n')
+    fake.chmod(0o755)
+    monkeypatch.setattr(mod, "SPRITE_ARGV_PREFIX", (str(fake),))
+    return mod, sess, log
+
+
+def test_sprite_run_falls_back_to_one_shot_when_shell_cannot_start(no_session_sprite):
+    mod, _sess, _log = no_session_sprite
+
+    assert mod._sprite_run("echo fallback; echo why >&2; exit 2", timeout=5) == (2, b"fallback\n", b"why\n")
+
+
+def test_sprite_run_skips_session_during_cooldown(no_session_sprite, monkeypatch):
+    mod, sess, log = no_session_sprite
+
+    for _ in range(3):
+        assert mod._sprite_run("echo ok", timeout=5) == (0, b"ok\n", b"")
+    # One failed session start, then straight to one-shot exec
+    assert log.read_text().split() == ["1", "3", "3", "3"]
+
+    monkeypatch.setattr(sess, "_down_until", 0.0)
+    mod._sprite_run("echo ok", timeout=5)
+    assert log.read_text().split()[4:] == ["1", "3"]
+
+
+def test_sprite_session_frames_output_larger_than_one_read(session):
+    _mod, sess = session
+
+    status, out, err = sess.run("head -c 300000 /dev/zero | tr '\\0' x; echo oops >&2")
+
+    assert (status, len(out), set(out), err) == (0, 300000, {ord("x")}, b"oops\n")
+
+
+def test_sprite_session_kill_closes_pipes(session):
+    _mod, sess = session
+    sess.run(":")
+    proc = sess._proc
+
+    sess._kill()
+
+    assert proc.stdin.closed and proc.stdout.closed and proc.stderr.closed
+
+
+@pytest.fixture()
+def env(tmp_path, monkeypatch):
+    """Fake sprite vault served by local bash, isolated jibrain intake dir."""
+    vault = tmp_path / "vault"
+    (vault / "agents" / "curator" / "extractions" / ".meta").mkdir(parents=True)
+    intake = tmp_path / "intake"
+    intake.mkdir()
+    calls = []
+
+    def fake_sprite_run(cmd, timeout):
+        calls.append(cmd)
+        result = subprocess.run(
+            ["bash", "-c", cmd.replace("/home/sprite/vault", str(vault))],
+            capture_output=True, timeout=timeout,
+        )
+        return result.returncode, result.stdout, result.stderr
+
+    mod = load_module()
+    monkeypatch.setattr(mod, "_sprite_run", fake_sprite_run)
+    monkeypatch.setattr(mod, "JIBRAIN_EXTRACTIONS", intake)
+    return mod, vault, intake, calls
+
+
+def test_pull_extraction_fetches_file_and_meta_in_one_call(env):
+    mod, vault, intake, calls = env
+    extractions = vault / "agents" / "curator" / "extractions"
+    (extractions / "note.md").write_text("---\ntitle: x\n---\n# Note\n")
+    (extractions / ".meta" / "note.json").write_text('{"source": "web"}')
+
+    mod.pull_extraction("agents/curator/extractions/note.md")
+
+    assert len(calls) == 1
+    assert (intake / "note.md").read_text() == "---\ntitle: x\n---\n# Note\n"
+    assert (intake / ".meta" / "note.json").read_text() == '{"source": "web"}'
+
+
+def test_pull_extraction_without_meta_skips_meta_file(env):
+    mod, vault, intake, _calls = env
+    (vault / "agents" / "curator" / "extractions" / "note.md").write_text("# Note\n")
+
+    mod.pull_extraction("agents/curator/extractions/note.md")
+
+    assert (intake / "note.md").read_text() == "# Note\n"
+    assert not (intake / ".meta" / "note.json").exists()
+
+
+def test_pull_extraction_missing_file_raises(env):
+    mod, _vault, intake, _calls = env
+
+    with pytest.raises(RuntimeError, match="Failed to read"):
+        mod.pull_extraction("agents/curator/extractions/missing.md")
+
+    assert not (intake / "missing.md").exists()
+
+
+def test_pull_extraction_writes_untagged_content_byte_for_byte(env):
+    mod, vault, intake, _calls = env
+    raw = b"# caf\xe9\r\n\xff\n"  # not valid UTF-8: must not be decoded
+    (vault / "agents" / "curator" / "extractions" / "note.md").write_bytes(raw)
+    (vault / "agents" / "curator" / "extractions" / ".meta" / "note.json").write_bytes(b'{"k": "\xe9"}')
+
+    mod.pull_extraction("agents/curator/extractions/note.md")
+
+    assert (intake / "note.md").read_bytes() == raw
+    assert (intake / ".meta" / "note.json").read_bytes() == b'{"k": "\xe9"}'
+
+
+def test_pull_extraction_injects_tags_and_preserves_utf8(env):
+    mod, vault, intake, _calls = env
+    (vault / "agents" / "curator" / "extractions" / "note.md").write_text(
+        "---\ntags: [web]\n---\n# 東京 café\n", encoding="utf-8")
+
+    mod.pull_extraction("agents/curator/extractions/note.md", extra_tags=["ws:medtech"])
+
+    text = (intake / "note.md").read_text(encoding="utf-8")
+    assert "tags: [ws:medtech, web]" in text
+    assert "workstream: medtech" in text
+    assert text.endswith("# 東京 café\n")
+
+
+def test_pull_extraction_replaces_existing_file_without_leaving_temp(env):
+    mod, vault, intake, _calls = env
+    (vault / "agents" / "curator" / "extractions" / "note.md").write_text("# New\n")
+    (intake / "note.md").write_text("# Old\n")
+
+    mod.pull_extraction("agents/curator/extractions/note.md")
+
+    assert (intake / "note.md").read_text() == "# New\n"
+    assert sorted(p.name for p in intake.iterdir()) == ["note.md"]
+
+
+@pytest.fixture()
+def health(monkeypatch):
+    """Relay module with a scripted upstream /health."""
+    mod = load_module()
+    upstream = []
+
+    def fake_api_request_raw(endpoint, timeout=120, **_kwargs):
+        assert endpoint == "/health"
+        assert timeout == mod.HEALTH_TIMEOUT
+        reply = upstream.pop(0)
+        if callable(reply):
+            reply = reply()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(mod, "api_request_raw", fake_api_request_raw)
+    return mod, upstream
+
+
+def test_cached_health_reuses_body_within_ttl(health):
+    mod, upstream = health
+    upstream.append(b'{"status": "ok"}')
+
+    assert mod.cached_health() == b'{"status": "ok"}'
+    assert mod.cached_health() == b'{"status": "ok"}'
+    assert upstream == []
+
+
+def test_cached_health_serves_stale_body_when_upstream_fails(health, monkeypatch):
+    mod, upstream = health
+    monkeypatch.setattr(mod, "HEALTH_CACHE_TTL", 0.0)
+    upstream.extend([b'{"status": "ok"}', RuntimeError("API connection error: down")])
+
+    mod.cached_health()
+
+    assert json.loads(mod.cached_health()) == {"status": "ok", "stale": True}
+
+
+def test_cached_health_raises_without_cached_body(health):
+    mod, upstream = health
+    upstream.append(RuntimeError("API connection error: down"))
+
+    with pytest.raises(RuntimeError, match="down"):
+        mod.cached_health()
+
+
+def test_cached_health_concurrent_misses_during_outage_share_one_call(health, monkeypatch):
+    mod, upstream = health
+    monkeypatch.setattr(mod, "HEALTH_CACHE_TTL", 0.0)
+    upstream.append(b'{"status": "ok"}')
+    mod.cached_health()
+    monkeypatch.setattr(mod, "HEALTH_CACHE_TTL", 60.0)
+    monkeypatch.setitem(mod._health_cache, "ts", 0.0)
+
+    def slow_failure():
+        time.sleep(0.3)
+        return RuntimeError("API connection error: timed out")
+
+    upstream.append(slow_failure)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(mod.cached_health())) for _ in range(5)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert time.monotonic() - started < 1.0
+    assert upstream == []
+    assert [json.loads(r) for r in results] == [{"status": "ok", "stale": True}] * 5
+
+
+def test_cached_health_caches_failure_without_body(health):
+    mod, upstream = health
+    upstream.append(RuntimeError("API connection error: down"))
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match="down"):
+            mod.cached_health()
+    assert upstream == []
+
+
+def test_cached_health_outage_longer_than_stale_max_raises(health, monkeypatch):
+    mod, upstream = health
+    monkeypatch.setattr(mod, "HEALTH_CACHE_TTL", 0.0)
+    upstream.extend([
+        b'{"status": "ok"}',
+        RuntimeError("API connection error: down"),
+        RuntimeError("API connection error: still down"),
+    ])
+    mod.cached_health()
+    assert json.loads(mod.cached_health())["stale"] is True
+
+    monkeypatch.setitem(mod._health_cache, "ok_ts", time.monotonic() - mod.HEALTH_STALE_MAX - 1)
+    with pytest.raises(RuntimeError, match="still down"):
+        mod.cached_health()
+
+
+def test_relay_health_returns_502_once_stale_max_exceeded(relay, monkeypatch):
+    mod, port = relay
+    monkeypatch.setitem(mod._health_cache, "body", b'{"status": "ok"}')
+    monkeypatch.setitem(mod._health_cache, "ok_ts", time.monotonic() - mod.HEALTH_STALE_MAX - 1)
+
+    def down(endpoint, **_kwargs):
+        raise RuntimeError("API connection error: down")
+
+    monkeypatch.setattr(mod, "api_request_raw", down)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", "/health")
+    resp = conn.getresponse()
+
+    assert resp.status == 502
+    assert json.loads(resp.read()) == {"error": "API connection error: down"}
+    conn.close()
@@ -0,0 +1,96 @@
+"""Tests for scripts/reminders-bridge.py JSON output and daemon loop (EventKit is stubbed)."""
+
+import importlib.util
+import io
+import json
+import sys
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+
+class ObjCString(str):
+    """Stands in for objc.pyobjc_unicode, the str subclass PyObjC returns."""
+
+
+def load_module(monkeypatch, with_orjson):
+    """Load reminders-bridge.py with EventKit/objc stubbed out (macOS-only deps)."""
+    monkeypatch.setitem(sys.modules, "EventKit", mock.MagicMock())
+    monkeypatch.setitem(sys.modules, "objc", mock.MagicMock())
+    monkeypatch.setitem(sys.modules, "dispatch", None)
+    if with_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setitem(sys.modules, "orjson", None)
+    spec = importlib.util.spec_from_file_location(
+        "reminders_bridge",
+        Path(__file__).parent.parent / "scripts" / "reminders-bridge.py",
+    )
+    assert spec is not None and spec.loader is not None
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "json"])
+def bridge(request, monkeypatch):
+    return load_module(monkeypatch, with_orjson=request.param)
+
+
+def fake_reminder(title, list_name):
+    cal = mock.Mock()
+    cal.title.return_value = ObjCString(list_name)
+    r = mock.Mock()
+    r.dueDateComponents.return_value = None
+    r.calendar.return_value = cal
+    r.calendarItemExternalIdentifier.return_value = ObjCString(f"id-{title}")
+    r.title.return_value = ObjCString(title)
+    r.isCompleted.return_value = False
+    r.priority.return_value = 0
+    r.notes.return_value = None
+    r.creationDate.return_value = None
+    return r
+
+
+def test_dumps_accepts_str_subclass_dict_keys(bridge):
+    assert json.loads(bridge.dumps({ObjCString("Inbox"): [1]})) == {"Inbox": [1]}
+
+
+def test_snapshot_with_pyobjc_list_names_serializes(bridge, monkeypatch):
+    reminders = [fake_reminder("milk", "Inbox"), fake_reminder("call", "Work")]
+    monkeypatch.setattr(bridge, "fetch_reminders", lambda *a, **kw: reminders)
+
+    out = json.loads(bridge.dumps(bridge.op_snapshot({})))
+
+    assert sorted(out["by_list"]) == ["Inbox", "Work"]
+    assert out["total"] == 2
+    assert type(bridge.reminder_to_dict(reminders[0])["list_name"]) is str
+
+
+def test_daemon_reports_unserializable_result_and_keeps_serving(bridge, monkeypatch, capsys):
+    monkeypatch.setitem(bridge.OPS, "list_lists", lambda _params: {"lists": [object()]})
+    monkeypatch.setitem(bridge.OPS, "snapshot", lambda _params: {"total": 0})
+    monkeypatch.setattr(sys, "stdin", io.StringIO(
+        '{"operation": "list_lists"}\nnot json\n{"operation": "snapshot"}\n'))
+
+    bridge.serve()
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(lines) == 3
+    assert lines[0]["error"].startswith("Failed to serialize result")
+    assert lines[1]["error"].startswith("Invalid JSON")
+    assert lines[2] == {"total": 0}
+
+
+def test_one_shot_unserializable_result_prints_error_and_exits_1(bridge, monkeypatch, capsys):
+    monkeypatch.setattr(bridge, "request_access", lambda: None)
+    monkeypatch.setattr(sys, "argv", ["reminders-bridge.py"])
+    monkeypatch.setitem(bridge.OPS, "list_lists", lambda _params: {"lists": [object()]})
+    monkeypatch.setattr(sys, "stdin", io.StringIO('{"operation": "list_lists"}'))
+
+    with pytest.raises(SystemExit) as exc_info:
+        bridge.main()
+
+    assert exc_info.value.code == 1
+    assert json.loads(capsys.readouterr().out)["error"].startswith("Failed to serialize result")